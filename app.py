@@ -1,48 +1,132 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Blueprint, Flask, render_template, jsonify, request
 from devicesMethods import add_device, load_devices_raw, remove_device, update_device
 from loadDevicesData import load_devices
-from networkMonitor import PING_INTERVAL, start_monitor, get_status, register_emitter, get_history, get_alerts, get_snmp_logs
-from flask_socketio import SocketIO
+from networkMonitor import PING_INTERVAL, start_monitor, stop_monitor, get_status, register_emitter, get_history, get_alerts, get_snmp_logs, get_device_groups
+from pingHistoryRecorder import start_recorder, stop_recorder
+from socketSubscriptions import build_slices, subscribe, unsubscribe
+from flask_socketio import SocketIO, join_room, leave_room
+import atexit
 import json
+import os
 import time
 
-app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins='*')
+socketio = SocketIO(cors_allowed_origins='*')
+bp = Blueprint('pinger', __name__)
+_services_started = False
 
-# register emitter so networkMonitor can push updates
+# emitter registered with networkMonitor (see create_app) so it can push updates
+# each subscription room gets only its slice, emitted (and serialized) once per room
 def _emitter(event, payload):
     try:
-        socketio.emit(event, payload, namespace='/')
+        for room, data in build_slices(event, payload, get_device_groups()):
+            socketio.emit(event, data, namespace='/', to=room)
     except Exception:
         pass
 
-register_emitter(_emitter)
-# Start background monitor after emitter is registered
-start_monitor()
+
+# ================================
+# Application factory and lifecycle
+# ================================
+def create_app(start_background=True):
+    """Build the Flask app. Background services start only when `start_background` is set."""
+    app = Flask(__name__)
+    # SNMP polling (and the pysnmp import) can be turned off with PINGER_SNMP_ENABLED=0
+    app.config['SNMP_ENABLED'] = os.environ.get('PINGER_SNMP_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    app.register_blueprint(bp)
+    socketio.init_app(app)
+    register_emitter(_emitter)
+    if start_background:
+        start_services(snmp_enabled=app.config['SNMP_ENABLED'])
+    return app
+
+
+def start_services(snmp_enabled=True):
+    """Start the monitor (and, lazily, the SNMP poller) and the history recorder.
+
+    Returns True once both are running. If either refuses to start (e.g. a
+    previous stop timed out and its thread is still alive) the other is
+    stopped again and False is returned, so a later call can retry.
+    """
+    global _services_started
+    if _services_started:
+        return True
+    monitor_started = start_monitor(snmp_enabled=snmp_enabled)
+    recorder_started = start_recorder()
+    if not (monitor_started and recorder_started):
+        if monitor_started:
+            stop_monitor()
+        if recorder_started:
+            stop_recorder()
+        return False
+    _services_started = True
+    atexit.register(stop_services)
+    return True
+
+
+def stop_services():
+    """Stop the background services. Returns True once their threads have exited."""
+    global _services_started
+    _services_started = False
+    atexit.unregister(stop_services)
+    recorder_stopped = stop_recorder()
+    monitor_stopped = stop_monitor()
+    return recorder_stopped and monitor_stopped
+
+
+# Socket.IO subscriptions
+@socketio.on('connect')
+def on_connect(auth=None):
+    # clients that never send `subscribe` keep receiving the full feed
+    _apply_subscription({})
+
+
+@socketio.on('subscribe')
+def on_subscribe(data):
+    """Replace this client's subscription. Payload: {events?: [...], groups?: [...], ips?: [...]}."""
+    if data is not None and not isinstance(data, dict):
+        return {"status": "error", "message": "Invalid subscription payload"}
+    try:
+        sub = _apply_subscription(data or {})
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "ok", "subscription": {k: list(v) for k, v in sub.items()}}
+
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    unsubscribe(request.sid)
+
+
+def _apply_subscription(data):
+    sub, room, previous = subscribe(request.sid, data)
+    if previous is not None:
+        leave_room(previous)
+    join_room(room)
+    return sub
 
 # Flask routes
-@app.route('/')
+@bp.route('/')
 def index():
     devices = load_devices()
     return render_template('index.html', devices=devices)
 
-@app.route('/switch-monitor')
+@bp.route('/switch-monitor')
 def switch_monitor():
     devices = load_devices()
     return render_template('switch-monitor.html', devices=devices)
 
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard():
     # Dashboard is rendered client-side using the existing APIs
     return render_template('dashboard.html')
 
 # API routes for device management
-@app.route('/api/devices', methods=['GET'])
+@bp.route('/api/devices', methods=['GET'])
 def api_get_devices():
     return jsonify(load_devices_raw())
 
-@app.route('/api/devices', methods=['POST'])
+@bp.route('/api/devices', methods=['POST'])
 def api_add_device():
     device = request.get_json()
     if not device:
@@ -61,10 +145,7 @@ def api_add_device():
         'msg': f"Device added: name={device.get('name')}, ip={device.get('ip')}, type={device.get('type')}, group={device.get('group')}",
         'device': device
     }
-    try:
-        socketio.emit('alert', alert)
-    except Exception:
-        pass
+    _emitter('alert', alert)
     try:
         with open('events.log', 'a') as f:
             f.write(json.dumps({'type': 'device_event', 'ts': alert['ts'], 'event': alert}) + "\n")
@@ -73,7 +154,7 @@ def api_add_device():
 
     return jsonify({"status": "success", "message": "Device added successfully"}), 201
 
-@app.route('/api/devices/<ip>', methods=['DELETE'])
+@bp.route('/api/devices/<ip>', methods=['DELETE'])
 def api_remove_device(ip):
     # capture device info before removal
     devices_all = load_devices_raw()
@@ -86,10 +167,7 @@ def api_remove_device(ip):
         'msg': f"Device removed: name={device_info.get('name') if device_info else ''}, ip={ip}",
         'device': device_info
     }
-    try:
-        socketio.emit('alert', alert)
-    except Exception:
-        pass
+    _emitter('alert', alert)
     try:
         with open('events.log', 'a') as f:
             f.write(json.dumps({'type': 'device_event', 'ts': alert['ts'], 'event': alert}) + "\n")
@@ -98,7 +176,7 @@ def api_remove_device(ip):
     return jsonify({"status": "ok"})
 
 
-@app.route('/api/devices/<ip>', methods=['PUT'])
+@bp.route('/api/devices/<ip>', methods=['PUT'])
 def api_update_device(ip):
     updated = request.get_json()
     if not updated:
@@ -117,10 +195,7 @@ def api_update_device(ip):
         'msg': f"Device updated: ip={ip}, changes={updated}",
         'changes': updated
     }
-    try:
-        socketio.emit('alert', alert)
-    except Exception:
-        pass
+    _emitter('alert', alert)
     try:
         with open('events.log', 'a') as f:
             f.write(json.dumps({'type': 'device_event', 'ts': alert['ts'], 'event': alert}) + "\n")
@@ -129,27 +204,31 @@ def api_update_device(ip):
 
     return jsonify({"status": "ok"})
 
-@app.route('/api/status')
+@bp.route('/api/status')
 def api_status():
     return jsonify(get_status())
 
 
-@app.route('/api/status/history')
+@bp.route('/api/status/history')
 def api_status_history():
     return jsonify(get_history())
 
 
-@app.route('/api/alerts')
+@bp.route('/api/alerts')
 def api_alerts():
     return jsonify(get_alerts())
 
 
-@app.route('/api/snmp')
+@bp.route('/api/snmp')
 def api_snmp():
     return jsonify(get_snmp_logs())
 
 
 
 if __name__ == '__main__':
+    app = create_app()
     # use SocketIO runner to support websocket connections
-    socketio.run(app, debug=True, host='0.0.0.0', use_reloader=False)
+    try:
+        socketio.run(app, debug=True, host='0.0.0.0', use_reloader=False)
+    finally:
+        stop_services()
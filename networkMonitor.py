@@ -7,17 +7,18 @@ from pingService import ping_ip
 from collections import deque
 import math
 import json
+import asyncio
+import importlib
+import importlib.util
 
-# SNMP imports (optional)
-try:
-    from pysnmp.hlapi import *
-    SNMP_AVAILABLE = True
-except ImportError:
-    SNMP_AVAILABLE = False
+# SNMP support is optional; pysnmp is only imported once the poller actually starts
+SNMP_AVAILABLE = importlib.util.find_spec('pysnmp') is not None
+_hlapi = None
 
 
 PING_INTERVAL = 1 # seconds (live updates)
 MAX_WORKERS = 50
+SNMP_INTERVAL = 30  # seconds between SNMP polls
 
 # History settings
 HISTORY_SIZE = 120  # keep last 120 samples per device
@@ -28,9 +29,15 @@ _device_status = {}
 _device_history = {}  # ip -> deque of samples {ts, latency, online}
 _alerts = deque(maxlen=200)
 _flapping_state = {}
+_device_groups = {}  # ip -> group, refreshed every sweep (used to route socket rooms)
 _emitter = None
 _lock = threading.Lock()
 
+# lifecycle of the background threads (see start_monitor / stop_monitor)
+_stop_event = threading.Event()
+_threads = {}
+_snmp_enabled = False
+
 # SNMP logs (populated if an SNMP poller is added)
 _snmp_logs = deque(maxlen=500)
 
@@ -49,17 +56,17 @@ def get_snmp_logs():
 def add_snmp_log(entry):
     with _lock:
         _snmp_logs.appendleft(entry)
-        # emit to subscribers
-        # persist to file
+    # persist to file
+    try:
+        _write_event_log({'type': 'snmp_log', 'ts': entry.get('ts', time.time()), 'entry': entry})
+    except Exception:
+        pass
+    # emit to subscribers outside the lock: the emitter may read monitor state
+    if _emitter:
         try:
-            _write_event_log({'type': 'snmp_log', 'ts': entry.get('ts', time.time()), 'entry': entry})
+            _emitter('snmp_log', entry)
         except Exception:
             pass
-        if _emitter:
-            try:
-                _emitter('snmp_log', entry)
-            except Exception:
-                pass
 
 def get_status():
     with _lock:
@@ -74,40 +81,69 @@ def get_alerts():
     with _lock:
         return list(_alerts)
 
+def get_device_groups():
+    with _lock:
+        return dict(_device_groups)
+
 def register_emitter(fn):
     """Register a callable `fn(event_name, payload)` used to push events (e.g., socketio.emit)."""
     global _emitter
     _emitter = fn
 
+# names the poller needs from pysnmp 7.x's asyncio high-level API
+_SNMP_API = ('get_cmd', 'bulk_walk_cmd', 'SnmpEngine', 'CommunityData',
+             'UdpTransportTarget', 'ContextData', 'ObjectType', 'ObjectIdentity')
+
+# IF-MIB objects by numeric OID (pysnmp does not ship IF-MIB compiled)
+OID_IF_NAME = '1.3.6.1.2.1.31.1.1.1.1'
+OID_IF_IN_OCTETS = '1.3.6.1.2.1.2.2.1.10'
+OID_IF_IN_ERRORS = '1.3.6.1.2.1.2.2.1.14'
+OID_IF_OUT_OCTETS = '1.3.6.1.2.1.2.2.1.16'
+OID_IF_OUT_ERRORS = '1.3.6.1.2.1.2.2.1.20'
+
+def _load_snmp():
+    """Import pysnmp's high-level API on first use. Returns the module or None."""
+    global _hlapi, SNMP_AVAILABLE
+    if _hlapi is None and SNMP_AVAILABLE:
+        try:
+            module = importlib.import_module('pysnmp.hlapi.v3arch.asyncio')
+        except ImportError:
+            module = None
+        if module is not None and all(hasattr(module, name) for name in _SNMP_API):
+            _hlapi = module
+        else:
+            SNMP_AVAILABLE = False
+    return _hlapi
+
 def query_snmp_device(ip, community='public', timeout=2, retries=1):
     """Query SNMP metrics from a device using pysnmp. Returns dict or None on failure."""
-    if not SNMP_AVAILABLE:
+    hlapi = _load_snmp()
+    if hlapi is None:
         return None
-    
     try:
+        return asyncio.run(_query_snmp_device(hlapi, ip, community, timeout, retries))
+    except Exception:
+        return None
+
+async def _query_snmp_device(hlapi, ip, community, timeout, retries):
+    engine = hlapi.SnmpEngine()
+    try:
+        auth = hlapi.CommunityData(community, mpModel=1)
+        target = await hlapi.UdpTransportTarget.create((ip, 161), timeout=timeout, retries=retries)
+        context = hlapi.ContextData()
+
         # Query system info OIDs
-        errorIndication, errorStatus, errorIndex, varBinds = next(
-            getCmd(SnmpEngine(),
-                   CommunityData(community, mpModel=1),
-                   UdpTransportTarget((ip, 161), timeout=timeout, retries=retries),
-                   ContextData(),
-                   ObjectType(ObjectIdentity('SNMPv2-MIB', 'sysUpTime', 0)),
-                   ObjectType(ObjectIdentity('SNMPv2-MIB', 'sysDescr', 0)))
-        )
-        
-        if errorIndication:
+        errorIndication, errorStatus, errorIndex, varBinds = await hlapi.get_cmd(
+            engine, auth, target, context,
+            hlapi.ObjectType(hlapi.ObjectIdentity('SNMPv2-MIB', 'sysUpTime', 0)),
+            hlapi.ObjectType(hlapi.ObjectIdentity('SNMPv2-MIB', 'sysDescr', 0)))
+
+        if errorIndication or errorStatus or len(varBinds) != 2:
             return None
-        
-        sys_uptime = None
-        sys_descr = None
-        
-        for varBind in varBinds:
-            oid, val = varBind
-            if '1.3.6.1.2.1.1.3' in str(oid):
-                sys_uptime = str(val)
-            elif '1.3.6.1.2.1.1.1' in str(oid):
-                sys_descr = str(val)
-        
+
+        # values come back in request order: sysUpTime, sysDescr
+        sys_uptime, sys_descr = (str(val) for _, val in varBinds)
+
         result = {
             'ip': ip,
             'ts': time.time(),
@@ -116,90 +152,72 @@ def query_snmp_device(ip, community='public', timeout=2, retries=1):
             'description': sys_descr or 'N/A',
             'interfaces': []
         }
-        
+
         # Query interface names
         try:
             ifNames = {}
-            for errorIndication, errorStatus, errorIndex, varBinds in bulkCmd(
-                SnmpEngine(),
-                CommunityData(community, mpModel=1),
-                UdpTransportTarget((ip, 161), timeout=timeout, retries=retries),
-                ContextData(),
+            async for errorIndication, errorStatus, errorIndex, varBinds in hlapi.bulk_walk_cmd(
+                engine, auth, target, context,
                 0, 10,
-                ObjectType(ObjectIdentity('SNMPv2-MIB', 'ifName'))
+                hlapi.ObjectType(hlapi.ObjectIdentity(OID_IF_NAME)),
+                lexicographicMode=False
             ):
-                if errorIndication:
+                if errorIndication or errorStatus:
                     break
-                for varBind in varBinds:
-                    oid, val = varBind
-                    oid_str = str(oid)
-                    if_index = oid_str.split('.')[-1]
+                for oid, val in varBinds:
+                    if_index = str(oid).split('.')[-1]
                     ifNames[if_index] = str(val)
-            
+
             # Query stats for each interface (limit to 5)
-            count = 0
             for if_index in sorted(ifNames.keys())[:5]:
-                errorIndication, errorStatus, errorIndex, varBinds = next(
-                    getCmd(SnmpEngine(),
-                           CommunityData(community, mpModel=1),
-                           UdpTransportTarget((ip, 161), timeout=timeout, retries=retries),
-                           ContextData(),
-                           ObjectType(ObjectIdentity('SNMPv2-MIB', 'ifInOctets', if_index)),
-                           ObjectType(ObjectIdentity('SNMPv2-MIB', 'ifOutOctets', if_index)),
-                           ObjectType(ObjectIdentity('SNMPv2-MIB', 'ifInErrors', if_index)),
-                           ObjectType(ObjectIdentity('SNMPv2-MIB', 'ifOutErrors', if_index)))
-                )
-                
-                if not errorIndication:
-                    in_octets = 0
-                    out_octets = 0
-                    in_errors = 0
-                    out_errors = 0
-                    
-                    for varBind in varBinds:
-                        oid, val = varBind
-                        oid_str = str(oid)
-                        try:
-                            val_int = int(val)
-                            if 'ifInOctets' in oid_str:
-                                in_octets = val_int
-                            elif 'ifOutOctets' in oid_str:
-                                out_octets = val_int
-                            elif 'ifInErrors' in oid_str:
-                                in_errors = val_int
-                            elif 'ifOutErrors' in oid_str:
-                                out_errors = val_int
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    result['interfaces'].append({
-                        'name': ifNames.get(if_index, f'Interface {if_index}'),
-                        'in_octets': in_octets,
-                        'out_octets': out_octets,
-                        'in_errors': in_errors,
-                        'out_errors': out_errors,
-                    })
+                errorIndication, errorStatus, errorIndex, varBinds = await hlapi.get_cmd(
+                    engine, auth, target, context,
+                    hlapi.ObjectType(hlapi.ObjectIdentity(f'{OID_IF_IN_OCTETS}.{if_index}')),
+                    hlapi.ObjectType(hlapi.ObjectIdentity(f'{OID_IF_OUT_OCTETS}.{if_index}')),
+                    hlapi.ObjectType(hlapi.ObjectIdentity(f'{OID_IF_IN_ERRORS}.{if_index}')),
+                    hlapi.ObjectType(hlapi.ObjectIdentity(f'{OID_IF_OUT_ERRORS}.{if_index}')))
+
+                if errorIndication or errorStatus or len(varBinds) != 4:
+                    continue
+
+                # values come back in request order: in/out octets, in/out errors
+                counters = []
+                for _, val in varBinds:
+                    try:
+                        counters.append(int(val))
+                    except (ValueError, TypeError):
+                        counters.append(0)
+                in_octets, out_octets, in_errors, out_errors = counters
+
+                result['interfaces'].append({
+                    'name': ifNames.get(if_index, f'Interface {if_index}'),
+                    'in_octets': in_octets,
+                    'out_octets': out_octets,
+                    'in_errors': in_errors,
+                    'out_errors': out_errors,
+                })
         except Exception as e:
             result['interfaces_error'] = str(e)
-        
+
         return result
-    except Exception as e:
-        return None
+    finally:
+        engine.close_dispatcher()
 
-def snmp_poller_loop(interval=30):
+def snmp_poller_loop(interval=SNMP_INTERVAL):
     """Background thread: poll SNMP metrics from online devices."""
     if not SNMP_AVAILABLE:
         return
     
-    while True:
-        time.sleep(interval)
-        devices = load_devices()
+    while not _stop_event.wait(interval):
+        devices = load_devices() or []
         
         with _lock:
             # Only query devices that are currently online
             online_ips = [ip for ip, s in _device_status.items() if s and s.get('online')]
         
         for ip in online_ips:
+            if _stop_event.is_set():
+                break
             # Find device config for SNMP community string
             device = next((d for d in devices if d['ip'] == ip), None)
             if not device:
@@ -217,16 +235,67 @@ def snmp_poller_loop(interval=30):
                 }
                 add_snmp_log(log_entry)
 
+def record_sample(ip, latency, online):
+    """Push a ping sample to the history of `ip` and raise a flapping alert when it starts flapping."""
+    alert = None
+    with _lock:
+        dq = _device_history.get(ip)
+        if dq is None:
+            dq = deque(maxlen=HISTORY_SIZE)
+            _device_history[ip] = dq
+        dq.append({
+            'ts': time.time(),
+            'latency': latency,
+            'online': online
+        })
+
+        # simple flapping detection on the recent window
+        samples = list(dq)[-FLAP_WINDOW:]
+        # count transitions between consecutive online states
+        transitions = 0
+        last_state = None
+        for s in samples:
+            st = bool(s.get('online'))
+            if last_state is None:
+                last_state = st
+                continue
+            if st != last_state:
+                transitions += 1
+                last_state = st
+
+        was_flapping = _flapping_state.get(ip, False)
+        now_flapping = transitions >= FLAP_THRESHOLD
+        _flapping_state[ip] = now_flapping
+        if now_flapping and not was_flapping:
+            alert = {'type': 'flapping', 'ip': ip, 'ts': time.time(), 'transitions': transitions}
+            _alerts.appendleft(alert)
+
+    if alert is None:
+        return
+    try:
+        _write_event_log({'type': 'alert', 'ts': alert['ts'], 'alert': alert})
+    except Exception:
+        pass
+    # emit outside the lock: the emitter may read monitor state
+    if _emitter:
+        try:
+            _emitter('alert', alert)
+        except Exception:
+            pass
+
 def monitor_loop():
-    global _device_status
+    global _device_status, _device_groups
 
-    while True:
+    while not _stop_event.is_set():
         devices = load_devices()
         if not devices:
-            time.sleep(PING_INTERVAL)
+            _stop_event.wait(PING_INTERVAL)
             continue
+        if _snmp_enabled and 'snmp' not in _threads and any(d.get('snmp_community') for d in devices):
+            start_snmp_poller()
         with _lock:
             prev_status = dict(_device_status)
+            _device_groups = {d["ip"]: d.get("group") for d in devices}
 
         results = {}
 
@@ -237,6 +306,10 @@ def monitor_loop():
             }
 
             for future in as_completed(future_map):
+                if _stop_event.is_set():
+                    # drop queued pings; only the ones already running are awaited
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
                 ip = future_map[future]
                 try:
                     latency = future.result()
@@ -253,47 +326,10 @@ def monitor_loop():
                     'last_seen': last_seen
                 }
 
-                # push to history
-                with _lock:
-                    dq = _device_history.get(ip)
-                    if dq is None:
-                        dq = deque(maxlen=HISTORY_SIZE)
-                        _device_history[ip] = dq
-                    dq.append({
-                        'ts': time.time(),
-                        'latency': latency,
-                        'online': online
-                    })
-
-                    # simple flapping detection on the recent window
-                    samples = list(dq)[-FLAP_WINDOW:]
-                    # count transitions between consecutive online states
-                    transitions = 0
-                    last_state = None
-                    for s in samples:
-                        st = bool(s.get('online'))
-                        if last_state is None:
-                            last_state = st
-                            continue
-                        if st != last_state:
-                            transitions += 1
-                            last_state = st
-
-                    was_flapping = _flapping_state.get(ip, False)
-                    now_flapping = transitions >= FLAP_THRESHOLD
-                    _flapping_state[ip] = now_flapping
-                    if now_flapping and not was_flapping:
-                        alert = {'type': 'flapping', 'ip': ip, 'ts': time.time(), 'transitions': transitions}
-                        _alerts.appendleft(alert)
-                        try:
-                            _write_event_log({'type': 'alert', 'ts': alert['ts'], 'alert': alert})
-                        except Exception:
-                            pass
-                        if _emitter:
-                            try:
-                                _emitter('alert', alert)
-                            except Exception:
-                                pass
+                record_sample(ip, latency, online)
+
+        if _stop_event.is_set():
+            break
 
         with _lock:
             _device_status = results
@@ -335,13 +371,57 @@ def monitor_loop():
             except Exception:
                 pass
 
-        time.sleep(PING_INTERVAL)
+        _stop_event.wait(PING_INTERVAL)
 
-def start_monitor():
-    t = threading.Thread(target=monitor_loop, daemon=True)
+def _start_thread(name, target, **kwargs):
+    def run():
+        try:
+            target(**kwargs)
+        finally:
+            # deregister on any exit so the service can be started again
+            with _lock:
+                if _threads.get(name) is t:
+                    del _threads[name]
+
+    t = threading.Thread(target=run, name=f'pinger-{name}', daemon=True)
+    with _lock:
+        _threads[name] = t
     t.start()
-    
-    # Start SNMP poller if available
-    if SNMP_AVAILABLE:
-        snmp_thread = threading.Thread(target=snmp_poller_loop, kwargs={'interval': 30}, daemon=True)
-        snmp_thread.start()
+    return t
+
+def start_monitor(snmp_enabled=True):
+    """Start the ping monitor thread. Returns False if a monitor is still running.
+
+    With `snmp_enabled`, the SNMP poller (and the pysnmp import) is started lazily
+    by the monitor once a device with `snmp_community` is configured.
+    """
+    global _snmp_enabled
+    with _lock:
+        if _threads:
+            # still running, or a previous stop_monitor() timed out before it exited
+            return False
+    _snmp_enabled = snmp_enabled and SNMP_AVAILABLE
+    _stop_event.clear()
+    _start_thread('monitor', monitor_loop)
+    return True
+
+def start_snmp_poller(interval=SNMP_INTERVAL):
+    with _lock:
+        if 'snmp' in _threads:
+            return
+    if _stop_event.is_set() or _load_snmp() is None:
+        return
+    _start_thread('snmp', snmp_poller_loop, interval=interval)
+
+def stop_monitor(timeout=5):
+    """Signal the monitor and SNMP threads to exit and wait for them.
+
+    Returns True once every thread has exited; threads that outlive `timeout`
+    stay registered (and keep start_monitor() from starting a duplicate).
+    """
+    _stop_event.set()
+    with _lock:
+        threads = list(_threads.values())
+    for t in threads:
+        t.join(timeout)
+    return not any(t.is_alive() for t in threads)
@@ -1,5 +1,5 @@
 from collections import defaultdict, deque
-from time import time,sleep
+from time import time
 import threading
 
 from networkMonitor import PING_INTERVAL, get_status
@@ -16,12 +16,16 @@ MAX_SAMPLES = (HISTORY_WINDOW_MINUTES * 60) // PING_INTERVAL
 # ================================    
 device_history = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
 
+_stop_event = threading.Event()
+_thread = None
+
 def history_recorder():
-    sleep(PING_INTERVAL * 2)  # initial delay
-    while True:
+    if _stop_event.wait(PING_INTERVAL * 2):  # initial delay
+        return
+    while not _stop_event.is_set():
         status = get_status() or {}
         record_history(status)
-        sleep(5)
+        _stop_event.wait(5)
 
 def record_history(status):
     now = time()
@@ -81,6 +85,27 @@ def get_worst_device():
     return worst_ip, round(worst_uptime, 1) if worst_ip else None
 
 # ================================
-# Start background thread
+# Background thread lifecycle
 # ================================
-threading.Thread(target=history_recorder, daemon=True).start()
\ No newline at end of file
+def start_recorder():
+    """Start the recorder thread. Returns False if a previous one is still running."""
+    global _thread
+    if _thread is not None:
+        if _thread.is_alive():
+            return False
+        _thread = None
+    _stop_event.clear()
+    _thread = threading.Thread(target=history_recorder, name='pinger-history', daemon=True)
+    _thread.start()
+    return True
+
+
+def stop_recorder(timeout=5):
+    """Stop the recorder thread; it is only forgotten once it has actually exited."""
+    global _thread
+    _stop_event.set()
+    if _thread is not None:
+        _thread.join(timeout)
+        if not _thread.is_alive():
+            _thread = None
+    return _thread is None
@@ -0,0 +1,156 @@
+import json
+import threading
+
+# Events a client may subscribe to
+EVENTS = ('status_update', 'alert', 'snmp_log')
+
+# Limits on client-supplied scopes; room names and per-sweep slicing grow with them
+MAX_SCOPE_ENTRIES = 100   # per `groups` / `ips` list
+MAX_SCOPE_LENGTH = 64     # characters per group name or ip
+
+# ================================
+# Subscriptions and rooms
+# ================================
+# Every client sits in exactly one room, named after its normalized
+# subscription. Clients with the same subscription share a room, so each
+# event is sliced and emitted once per distinct subscription and every
+# client gets at most one message per event. Since a client is in one room
+# only, there are never more rooms than connected clients.
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value if v not in (None, '')]
+    return [str(value)]
+
+
+def _scope(subscription, key):
+    values = set(_as_list(subscription.get(key)))
+    if len(values) > MAX_SCOPE_ENTRIES:
+        raise ValueError(f"Too many {key}: at most {MAX_SCOPE_ENTRIES} allowed")
+    if any(len(v) > MAX_SCOPE_LENGTH for v in values):
+        raise ValueError(f"Invalid {key}: entries are limited to {MAX_SCOPE_LENGTH} characters")
+    return tuple(sorted(values))
+
+
+def normalize(subscription):
+    """Normalize a payload `{events, groups, ips}` into sorted tuples.
+
+    Missing `events` means all events; missing `groups` and `ips` means the full feed.
+    Raises ValueError for unknown event names or oversized `groups`/`ips`.
+    """
+    subscription = subscription or {}
+    events = _as_list(subscription.get('events'))
+    unknown = [e for e in events if e not in EVENTS]
+    if unknown:
+        raise ValueError(f"Unknown events: {', '.join(unknown)}")
+    return {
+        'events': tuple(sorted(set(events) or EVENTS)),
+        'groups': _scope(subscription, 'groups'),
+        'ips': _scope(subscription, 'ips'),
+    }
+
+
+def room_name(sub):
+    return 'sub:' + json.dumps([sub['events'], sub['groups'], sub['ips']])
+
+
+# room -> {'sub': normalized subscription, 'sids': set of sids}
+_rooms = {}
+# sid -> room
+_client_room = {}
+_lock = threading.Lock()
+
+
+def subscribe(sid, subscription):
+    """Move `sid` to the room of `subscription`.
+
+    Returns (sub, room, previous_room); previous_room is None when unchanged.
+    Raises ValueError for an invalid subscription (the client keeps its room).
+    """
+    sub = normalize(subscription)
+    room = room_name(sub)
+    with _lock:
+        previous = _client_room.get(sid)
+        if previous == room:
+            return sub, room, None
+        if previous is not None:
+            _discard(previous, sid)
+        _rooms.setdefault(room, {'sub': sub, 'sids': set()})['sids'].add(sid)
+        _client_room[sid] = room
+    return sub, room, previous
+
+
+def unsubscribe(sid):
+    """Forget the room of `sid` (e.g. on disconnect). Returns the room left, if any."""
+    with _lock:
+        room = _client_room.pop(sid, None)
+        if room is not None:
+            _discard(room, sid)
+    return room
+
+
+def _discard(room, sid):
+    entry = _rooms.get(room)
+    if entry is None:
+        return
+    entry['sids'].discard(sid)
+    if not entry['sids']:
+        del _rooms[room]
+
+
+def get_active_rooms():
+    with _lock:
+        return {room: entry['sub'] for room, entry in _rooms.items()}
+
+
+# ================================
+# Fan-out
+# ================================
+def _payload_ip(event, payload):
+    if event == 'snmp_log':
+        return (payload.get('data') or {}).get('ip') or payload.get('ip')
+    return payload.get('ip')
+
+
+def _matches(sub, ip, group):
+    if not sub['groups'] and not sub['ips']:
+        return True
+    return ip in sub['ips'] or (group is not None and group in sub['groups'])
+
+
+def build_slices(event, payload, device_groups):
+    """Return [(room, payload_slice)] for every active room subscribed to `event`.
+
+    `device_groups` maps ip -> group. A room whose subscription names several
+    groups and/or ips gets one merged slice, so the socket layer serializes it
+    once per room and each client receives a single message per event.
+    """
+    slices = []
+    cache = {}  # (groups, ips) -> slice, shared by rooms that differ only in events
+    for room, sub in get_active_rooms().items():
+        if event not in sub['events']:
+            continue
+        scope = (sub['groups'], sub['ips'])
+        if scope not in cache:
+            cache[scope] = _slice(event, payload, sub, device_groups)
+        if cache[scope]:
+            slices.append((room, cache[scope]))
+    return slices
+
+
+def _slice(event, payload, sub, device_groups):
+    if event == 'status_update':
+        if not sub['groups'] and not sub['ips']:
+            return payload
+        return {ip: entry for ip, entry in payload.items()
+                if _matches(sub, ip, device_groups.get(ip))}
+
+    # per-device events (alert, snmp_log): route by the device the event refers to
+    ip = _payload_ip(event, payload)
+    group = device_groups.get(ip) if ip else None
+    if group is None and isinstance(payload.get('device'), dict):
+        group = payload['device'].get('group')
+    return payload if _matches(sub, ip, group) else None
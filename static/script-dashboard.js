@@ -356,6 +356,8 @@ function setupSocket() {
 
   socket.on('connect', () => {
     console.log('socket connected');
+    // dashboard aggregates every device, so it takes the full (unscoped) feed
+    socket.emit('subscribe', { events: ['status_update', 'alert', 'snmp_log'] });
   });
 
   socket.on('status_update', (data) => {
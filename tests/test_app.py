@@ -0,0 +1,147 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app
+import networkMonitor as nm
+import socketSubscriptions as subs
+
+
+class SocketSubscriptionTest(unittest.TestCase):
+    def setUp(self):
+        subs._rooms.clear()
+        subs._client_room.clear()
+        self.app = app.create_app(start_background=False)
+        patcher = mock.patch.object(nm, '_device_groups', {'10.0.0.1': 'core', '10.0.0.2': 'edge'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(nm, '_write_event_log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.socketio.test_client(self.app)
+        self.addCleanup(lambda: self.client.is_connected() and self.client.disconnect())
+
+    def test_connect_joins_full_feed(self):
+        self.assertEqual(list(subs.get_active_rooms().values()), [subs.normalize({})])
+        app._emitter('status_update', {'10.0.0.1': {'online': True}, '10.0.0.2': {'online': False}})
+        received = self.client.get_received()
+        self.assertEqual([m['name'] for m in received], ['status_update'])
+        self.assertEqual(set(received[0]['args'][0]), {'10.0.0.1', '10.0.0.2'})
+
+    def test_scoped_subscription_gets_one_merged_message(self):
+        ack = self.client.emit('subscribe', {'groups': ['core'], 'ips': ['10.0.0.1']}, callback=True)
+        self.assertEqual(ack['status'], 'ok')
+        app._emitter('status_update', {'10.0.0.1': {'online': True}, '10.0.0.2': {'online': False}})
+        app._emitter('alert', {'type': 'offline', 'ip': '10.0.0.1'})
+        app._emitter('alert', {'type': 'offline', 'ip': '10.0.0.2'})
+        received = self.client.get_received()
+        self.assertEqual([(m['name'], list(m['args'][0])) for m in received],
+                         [('status_update', ['10.0.0.1']), ('alert', ['type', 'ip'])])
+        self.assertEqual(received[1]['args'][0]['ip'], '10.0.0.1')
+
+    def test_invalid_subscription_is_rejected(self):
+        ack = self.client.emit('subscribe', {'events': 'bogus'}, callback=True)
+        self.assertEqual(ack['status'], 'error')
+        ack = self.client.emit('subscribe', {'ips': ['x' * (subs.MAX_SCOPE_LENGTH + 1)]}, callback=True)
+        self.assertEqual(ack['status'], 'error')
+        self.assertEqual(list(subs.get_active_rooms().values()), [subs.normalize({})])
+
+    def test_disconnect_drops_room(self):
+        self.client.disconnect()
+        self.assertEqual(subs.get_active_rooms(), {})
+
+    def test_monitor_call_site_reaches_client(self):
+        self.client.emit('subscribe', {'events': ['snmp_log'], 'groups': ['core']})
+        nm.add_snmp_log({'ts': 1, 'msg': 'SNMP', 'data': {'ip': '10.0.0.1'}})
+        nm.add_snmp_log({'ts': 2, 'msg': 'SNMP', 'data': {'ip': '10.0.0.2'}})
+        received = self.client.get_received()
+        self.assertEqual([(m['name'], m['args'][0]['ts']) for m in received], [('snmp_log', 1)])
+
+
+
+def _run_script(script, **env):
+    """Run `script` in a fresh interpreter (clean sys.modules and threads); returns its stdout."""
+    result = subprocess.run([sys.executable, '-c', textwrap.dedent(script)], cwd=ROOT,
+                            env={**os.environ, **env}, capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise AssertionError(result.stderr)
+    return result.stdout.strip().splitlines()[-1]
+
+
+# start the services against a single SNMP-enabled device without touching the network or events.log
+SERVICES_SCRIPT = """
+    import sys, time
+    import networkMonitor as nm
+    nm.load_devices = lambda: [{'ip': '10.0.0.1', 'snmp_community': 'public'}]
+    nm.ping_ip = lambda ip: 1.0
+    nm._write_event_log = lambda entry: None
+    import app
+    app.create_app()
+    # the SNMP decision is taken at the start of a sweep, before its status is published
+    while not nm.get_status():
+        time.sleep(0.05)
+    print('pysnmp' in sys.modules, 'snmp' in nm._threads, app.stop_services())
+"""
+
+
+class StartupTest(unittest.TestCase):
+    def test_import_has_no_side_effects(self):
+        out = _run_script("""
+            import sys, threading
+            import app
+            print(threading.active_count(), any(m.split('.')[0] == 'pysnmp' for m in sys.modules))
+        """)
+        self.assertEqual(out, '1 False')
+
+    def test_create_app_without_background_starts_nothing(self):
+        before = {t.name for t in threading.enumerate()}
+        app.create_app(start_background=False)
+        self.assertEqual({t.name for t in threading.enumerate()} - before, set())
+        self.assertEqual(nm._threads, {})
+
+    def test_snmp_disabled_keeps_pysnmp_unloaded(self):
+        self.assertEqual(_run_script(SERVICES_SCRIPT, PINGER_SNMP_ENABLED='0'), 'False False True')
+
+    @unittest.skipUnless(importlib.util.find_spec('pysnmp'), 'pysnmp not installed')
+    def test_snmp_enabled_loads_pysnmp_for_snmp_devices(self):
+        self.assertEqual(_run_script(SERVICES_SCRIPT, PINGER_SNMP_ENABLED='1'), 'True True True')
+
+
+class ServicesTest(unittest.TestCase):
+    def setUp(self):
+        self.mocks = {}
+        for name in ('start_monitor', 'stop_monitor', 'start_recorder', 'stop_recorder'):
+            patcher = mock.patch.object(app, name, return_value=True)
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(app.stop_services)
+
+    def test_refused_monitor_is_not_reported_as_started(self):
+        self.mocks['start_monitor'].return_value = False
+        self.assertFalse(app.start_services())
+        self.assertFalse(app._services_started)
+        self.mocks['stop_recorder'].assert_called_once()
+
+        self.mocks['start_monitor'].return_value = True
+        self.assertTrue(app.start_services())
+        self.assertTrue(app._services_started)
+        self.assertTrue(app.start_services())
+        self.assertEqual(self.mocks['start_monitor'].call_count, 2)
+
+    def test_stop_reports_threads_still_running(self):
+        self.assertTrue(app.start_services())
+        self.mocks['stop_monitor'].return_value = False
+        self.assertFalse(app.stop_services())
+        self.assertFalse(app._services_started)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import networkMonitor as nm
+import pingHistoryRecorder as ph
+
+
+def _run_with_timeout(fn, timeout=2):
+    t = threading.Thread(target=fn, daemon=True)
+    t.start()
+    t.join(timeout)
+    return not t.is_alive()
+
+
+class EmitterLockTest(unittest.TestCase):
+    """The emitter reads monitor state (get_device_groups), so it must never run under _lock."""
+
+    def setUp(self):
+        self.events = []
+        patcher = mock.patch.object(nm, '_write_event_log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(nm.register_emitter, nm._emitter)
+        nm.register_emitter(self._locking_emitter)
+        nm._device_history.pop('10.0.0.1', None)
+        nm._flapping_state.pop('10.0.0.1', None)
+
+    def _locking_emitter(self, event, payload):
+        nm.get_device_groups()
+        self.events.append((event, payload))
+
+    def test_add_snmp_log_emits_outside_lock(self):
+        entry = {'ts': 1, 'msg': 'SNMP', 'data': {'ip': '10.0.0.1'}}
+        self.assertTrue(_run_with_timeout(lambda: nm.add_snmp_log(entry)))
+        self.assertEqual(self.events, [('snmp_log', entry)])
+        self.assertEqual(nm.get_snmp_logs()[0], entry)
+
+    def test_flapping_alert_emits_outside_lock(self):
+        def flap():
+            for i in range(nm.FLAP_THRESHOLD + 1):
+                nm.record_sample('10.0.0.1', None, bool(i % 2))
+
+        self.assertTrue(_run_with_timeout(flap))
+        self.assertEqual([(e, p['type'], p['ip']) for e, p in self.events],
+                         [('alert', 'flapping', '10.0.0.1')])
+        self.assertTrue(_run_with_timeout(nm.get_status))
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class MonitorLifecycleTest(unittest.TestCase):
+    def setUp(self):
+        self.devices = []
+        for name, value in (('load_devices', lambda: self.devices),
+                            ('ping_ip', lambda ip: 1.0),
+                            ('_write_event_log', lambda entry: None),
+                            ('start_snmp_poller', mock.Mock())):
+            patcher = mock.patch.object(nm, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(nm.stop_monitor)
+
+    def test_start_stop_repeatedly(self):
+        for _ in range(2):
+            self.assertTrue(nm.start_monitor(snmp_enabled=False))
+            self.assertFalse(nm.start_monitor(snmp_enabled=False))
+            self.assertTrue(nm.stop_monitor())
+            self.assertEqual(nm._threads, {})
+
+    def test_timed_out_stop_blocks_duplicate_monitor(self):
+        gate = threading.Event()
+        with mock.patch.object(nm, 'load_devices', lambda: gate.wait() and []):
+            self.assertTrue(nm.start_monitor(snmp_enabled=False))
+            self.assertFalse(nm.stop_monitor(timeout=0.1))
+            self.assertFalse(nm.start_monitor(snmp_enabled=False))
+            gate.set()
+            self.assertTrue(nm.stop_monitor())
+        self.assertTrue(nm.start_monitor(snmp_enabled=False))
+
+    def test_snmp_poller_needs_flag_and_community(self):
+        cases = (
+            (False, [{'ip': '10.0.0.1', 'snmp_community': 'public'}], False),
+            (True, [{'ip': '10.0.0.1'}], False),
+            (True, [{'ip': '10.0.0.1', 'snmp_community': 'public'}], True),
+        )
+        for snmp_enabled, devices, expected in cases:
+            self.devices = devices
+            nm.start_snmp_poller.reset_mock()
+            with mock.patch.object(nm, 'SNMP_AVAILABLE', True), mock.patch.object(nm, '_device_status', {}):
+                nm.start_monitor(snmp_enabled=snmp_enabled)
+                self.assertTrue(_wait_for(lambda: nm.get_status()))
+                self.assertTrue(nm.stop_monitor())
+            self.assertEqual(nm.start_snmp_poller.called, expected)
+
+    def test_crashed_thread_deregisters(self):
+        with mock.patch.object(threading, 'excepthook', lambda args: None):
+            nm._start_thread('snmp', lambda: 1 / 0).join()
+        self.assertNotIn('snmp', nm._threads)
+
+
+class RecorderLifecycleTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(ph.stop_recorder)
+
+    def test_start_stop_repeatedly(self):
+        for _ in range(2):
+            self.assertTrue(ph.start_recorder())
+            self.assertFalse(ph.start_recorder())
+            self.assertTrue(ph.stop_recorder())
+
+    def test_timed_out_stop_blocks_duplicate_recorder(self):
+        gate = threading.Event()
+        entered = threading.Event()
+
+        def blocking_status():
+            entered.set()
+            gate.wait()
+            return {}
+
+        with mock.patch.object(ph, 'PING_INTERVAL', 0), mock.patch.object(ph, 'get_status', blocking_status):
+            self.assertTrue(ph.start_recorder())
+            self.assertTrue(entered.wait(2))
+            self.assertFalse(ph.stop_recorder(timeout=0.1))
+            self.assertFalse(ph.start_recorder())
+            gate.set()
+            self.assertTrue(ph.stop_recorder())
+        self.assertTrue(ph.start_recorder())
+
+
+def _fake_hlapi(system, names, interfaces):
+    """Stand-in for pysnmp.hlapi.v3arch.asyncio returning canned responses."""
+    engines = []
+
+    class SnmpEngine:
+        def __init__(self):
+            self.closed = False
+            engines.append(self)
+
+        def close_dispatcher(self):
+            self.closed = True
+
+    class UdpTransportTarget:
+        @classmethod
+        async def create(cls, address, **kwargs):
+            return address
+
+    async def get_cmd(engine, auth, target, context, *var_binds):
+        first = var_binds[0]
+        if first[0] == 'SNMPv2-MIB':
+            return system
+        return interfaces[first[0].rsplit('.', 1)[1]]
+
+    async def bulk_walk_cmd(engine, auth, target, context, non_repeaters, max_repetitions, var_bind, **options):
+        for row in names:
+            yield row
+
+    return types.SimpleNamespace(
+        engines=engines, SnmpEngine=SnmpEngine, UdpTransportTarget=UdpTransportTarget,
+        get_cmd=get_cmd, bulk_walk_cmd=bulk_walk_cmd,
+        CommunityData=lambda *args, **kwargs: None, ContextData=lambda: None,
+        ObjectType=lambda identity: identity, ObjectIdentity=lambda *args: args,
+    )
+
+
+SYSTEM_OK = (None, 0, 0, [('sysUpTime', '12345'), ('sysDescr', 'Juniper EX2200')])
+NAMES = [(None, 0, 0, [(f'{nm.OID_IF_NAME}.1', 'ge-0/0/1'), (f'{nm.OID_IF_NAME}.2', 'ge-0/0/2')])]
+
+
+class SnmpQueryTest(unittest.TestCase):
+    def query(self, system=SYSTEM_OK, names=NAMES, interfaces=None):
+        self.hlapi = _fake_hlapi(system, names, interfaces or {})
+        with mock.patch.object(nm, '_hlapi', self.hlapi), mock.patch.object(nm, 'SNMP_AVAILABLE', True):
+            result = nm.query_snmp_device('10.0.0.1', community='private')
+        self.assertTrue(all(e.closed for e in self.hlapi.engines))
+        return result
+
+    def test_result_assembly(self):
+        result = self.query(interfaces={
+            '1': (None, 0, 0, [('in', 100), ('out', 200), ('in_err', 1), ('out_err', 'n/a')]),
+            '2': (None, 0, 0, [('in', 5), ('out', 6), ('in_err', 0), ('out_err', 0)]),
+        })
+        self.assertEqual((result['ip'], result['uptime'], result['description']),
+                         ('10.0.0.1', '12345', 'Juniper EX2200'))
+        self.assertEqual(result['interfaces'], [
+            {'name': 'ge-0/0/1', 'in_octets': 100, 'out_octets': 200, 'in_errors': 1, 'out_errors': 0},
+            {'name': 'ge-0/0/2', 'in_octets': 5, 'out_octets': 6, 'in_errors': 0, 'out_errors': 0},
+        ])
+        self.assertNotIn('interfaces_error', result)
+
+    def test_system_error_status_returns_none(self):
+        self.assertIsNone(self.query(system=(None, 2, 1, [])))
+        self.assertIsNone(self.query(system=('requestTimedOut', 0, 0, [])))
+
+    def test_system_varbind_mismatch_returns_none(self):
+        self.assertIsNone(self.query(system=(None, 0, 0, [('sysUpTime', '12345')])))
+
+    def test_bad_interface_rows_are_skipped(self):
+        result = self.query(interfaces={
+            '1': (None, 2, 1, []),
+            '2': (None, 0, 0, [('in', 5), ('out', 6)]),
+        })
+        self.assertEqual(result['interfaces'], [])
+        self.assertNotIn('interfaces_error', result)
+
+    def test_walk_error_stops_interface_listing(self):
+        result = self.query(names=[(None, 2, 1, [])])
+        self.assertEqual(result['interfaces'], [])
+
+    def test_load_snmp_without_api_returns_none(self):
+        with mock.patch.object(nm, '_hlapi', None), mock.patch.object(nm, 'SNMP_AVAILABLE', True), \
+                mock.patch.object(nm.importlib, 'import_module', return_value=types.SimpleNamespace()):
+            self.assertIsNone(nm._load_snmp())
+            self.assertFalse(nm.SNMP_AVAILABLE)
+            self.assertIsNone(nm.query_snmp_device('10.0.0.1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketSubscriptions as subs
+
+GROUPS = {'10.0.0.1': 'core', '10.0.0.2': 'access', '10.0.0.3': 'edge'}
+STATUS = {ip: {'online': True} for ip in GROUPS}
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_defaults_to_full_feed(self):
+        sub = subs.normalize({})
+        self.assertEqual(sub, {'events': tuple(sorted(subs.EVENTS)), 'groups': (), 'ips': ()})
+
+    def test_equivalent_subscriptions_share_a_room(self):
+        a = subs.normalize({'groups': ['b', 'a'], 'events': 'alert'})
+        b = subs.normalize({'groups': ('a', 'b', 'a'), 'events': ['alert']})
+        self.assertEqual(subs.room_name(a), subs.room_name(b))
+
+    def test_unknown_events_are_rejected(self):
+        with self.assertRaises(ValueError):
+            subs.normalize({'events': 'bogus'})
+        with self.assertRaises(ValueError):
+            subs.normalize({'events': ['alert', 'bogus']})
+
+    def test_oversized_scopes_are_rejected(self):
+        with self.assertRaises(ValueError):
+            subs.normalize({'ips': [f'10.0.{i // 250}.{i % 250}' for i in range(subs.MAX_SCOPE_ENTRIES + 1)]})
+        with self.assertRaises(ValueError):
+            subs.normalize({'groups': ['g' * (subs.MAX_SCOPE_LENGTH + 1)]})
+        sub = subs.normalize({'groups': ['g' * subs.MAX_SCOPE_LENGTH]})
+        self.assertEqual(len(sub['groups']), 1)
+
+
+class SubscribeTest(unittest.TestCase):
+    def setUp(self):
+        subs._rooms.clear()
+        subs._client_room.clear()
+
+    def test_resubscribe_moves_client(self):
+        _, first, previous = subs.subscribe('a', {})
+        self.assertIsNone(previous)
+        _, second, previous = subs.subscribe('a', {'ips': ['10.0.0.1']})
+        self.assertEqual(previous, first)
+        self.assertEqual(set(subs.get_active_rooms()), {second})
+
+    def test_invalid_subscription_keeps_room(self):
+        _, room, _ = subs.subscribe('a', {'groups': ['core']})
+        with self.assertRaises(ValueError):
+            subs.subscribe('a', {'events': 'bogus'})
+        self.assertEqual(set(subs.get_active_rooms()), {room})
+
+    def test_unsubscribe_drops_empty_room(self):
+        _, room, _ = subs.subscribe('a', {})
+        subs.subscribe('b', {})
+        self.assertEqual(subs.unsubscribe('a'), room)
+        self.assertIn(room, subs.get_active_rooms())
+        subs.unsubscribe('b')
+        self.assertEqual(subs.get_active_rooms(), {})
+
+
+class BuildSlicesTest(unittest.TestCase):
+    def setUp(self):
+        subs._rooms.clear()
+        subs._client_room.clear()
+
+    def test_no_rooms_no_work(self):
+        self.assertEqual(subs.build_slices('status_update', STATUS, GROUPS), [])
+
+    def test_multi_scope_status_is_one_merged_slice(self):
+        _, room, _ = subs.subscribe('a', {'groups': ['core', 'access'], 'ips': ['10.0.0.1']})
+        slices = subs.build_slices('status_update', STATUS, GROUPS)
+        self.assertEqual(slices, [(room, {'10.0.0.1': STATUS['10.0.0.1'], '10.0.0.2': STATUS['10.0.0.2']})])
+
+    def test_full_feed_gets_whole_payload(self):
+        _, room, _ = subs.subscribe('a', {})
+        self.assertEqual(subs.build_slices('status_update', STATUS, GROUPS), [(room, STATUS)])
+
+    def test_alert_delivered_once_per_matching_room(self):
+        _, scoped, _ = subs.subscribe('a', {'groups': ['core'], 'ips': ['10.0.0.1']})
+        _, other, _ = subs.subscribe('b', {'groups': ['edge']})
+        alert = {'type': 'offline', 'ip': '10.0.0.1'}
+        self.assertEqual(subs.build_slices('alert', alert, GROUPS), [(scoped, alert)])
+
+    def test_alert_for_new_device_uses_payload_group(self):
+        _, room, _ = subs.subscribe('a', {'groups': ['lab']})
+        alert = {'type': 'device_added', 'ip': '10.9.9.9', 'device': {'group': 'lab'}}
+        self.assertEqual(subs.build_slices('alert', alert, GROUPS), [(room, alert)])
+
+    def test_snmp_log_routed_by_data_ip(self):
+        _, room, _ = subs.subscribe('a', {'ips': ['10.0.0.3'], 'events': ['snmp_log']})
+        entry = {'msg': 'SNMP', 'data': {'ip': '10.0.0.3'}}
+        self.assertEqual(subs.build_slices('snmp_log', entry, GROUPS), [(room, entry)])
+        self.assertEqual(subs.build_slices('status_update', STATUS, GROUPS), [])
+
+
+if __name__ == '__main__':
+    unittest.main()